@@ -1,15 +1,51 @@
 """
 Database module for persistence using SQLAlchemy with SQLite
 """
-from sqlalchemy import create_engine, Column, String, Integer, JSON, DateTime, ForeignKey, Text
+from sqlalchemy import create_engine, event, inspect, make_url, text, Column, String, Integer, JSON, DateTime, ForeignKey, Text, Index
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, relationship
-from datetime import datetime
+from sqlalchemy.pool import QueuePool, StaticPool
+from sqlalchemy.sql import func
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./game_data.db")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Connections kept open in the pool, plus extra connections allowed under load
+POOL_SIZE = 4
+POOL_MAX_OVERFLOW = 8
+
+_url = make_url(DATABASE_URL)
+_is_sqlite = _url.get_backend_name() == "sqlite"
+
+if _is_sqlite and _url.database in (None, "", ":memory:"):
+    # Each connection to an in-memory database gets its own empty database,
+    # so all sessions must share a single connection
+    engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False}, poolclass=StaticPool)
+else:
+    engine = create_engine(
+        DATABASE_URL,
+        connect_args={"check_same_thread": False} if _is_sqlite else {},
+        poolclass=QueuePool,
+        pool_size=POOL_SIZE,
+        max_overflow=POOL_MAX_OVERFLOW,
+        pool_pre_ping=not _is_sqlite,  # a local database file cannot drop the connection
+        pool_recycle=3600,
+    )
+
+if _is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        """Use WAL journaling with relaxed fsync and larger in-memory caches"""
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.execute("PRAGMA busy_timeout=5000")
+        cursor.close()
+
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
@@ -19,7 +55,7 @@ class DBCharacter(Base):
     __tablename__ = "characters"
     
     id = Column(String, primary_key=True)  # UUID
-    player_name = Column(String, nullable=False)
+    player_name = Column(String, nullable=False, index=True)
     name = Column(String, nullable=False)
     class_type = Column(String, nullable=False)
     level = Column(Integer, default=1)
@@ -33,8 +69,8 @@ class DBCharacter(Base):
     hit_points = Column(Integer, default=10)
     max_hit_points = Column(Integer, default=10)
     backstory = Column(Text, nullable=True)
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now())
     
     # Relationships
     game_characters = relationship("DBGameCharacter", back_populates="character")
@@ -46,22 +82,42 @@ class DBGame(Base):
     
     game_id = Column(String, primary_key=True)  # UUID
     turn_index = Column(Integer, default=0)
-    logs = Column(JSON, default=[])  # List of events
+    logs = Column(JSON, default=[])  # Deprecated: events are stored in game_events; only read for older games
     meta = Column(JSON, default={})
-    created_at = Column(DateTime, default=datetime.utcnow)
-    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    players = Column(JSON, nullable=True)  # [{"id", "name"}, ...]; NULL for games saved before it existed
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+    updated_at = Column(DateTime, default=func.now(), server_default=func.now(), onupdate=func.now(), index=True)
     
     # Relationships
     game_characters = relationship("DBGameCharacter", back_populates="game")
 
 
+class DBGameEvent(Base):
+    """A single entry of a game's event log"""
+    __tablename__ = "game_events"
+    __table_args__ = (
+        Index("ix_game_events_game_seq", "game_id", "seq", unique=True),
+    )
+    
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    game_id = Column(String, ForeignKey("games.game_id"), nullable=False)
+    seq = Column(Integer, nullable=False)  # Position of the event in the game log, starting at 1
+    type = Column(String, nullable=False)
+    payload = Column(JSON, default={})
+    created_at = Column(DateTime, default=func.now(), server_default=func.now())
+
+
 class DBGameCharacter(Base):
     """Many-to-many relationship between games and characters"""
     __tablename__ = "game_characters"
+    __table_args__ = (
+        # Also serves lookups by game_id alone
+        Index("ix_gc_game_player", "game_id", "player_id"),
+    )
     
     id = Column(Integer, primary_key=True, autoincrement=True)
     game_id = Column(String, ForeignKey("games.game_id"), nullable=False)
-    character_id = Column(String, ForeignKey("characters.id"), nullable=False)
+    character_id = Column(String, ForeignKey("characters.id"), nullable=False, index=True)
     player_id = Column(String, nullable=False)  # In-game player ID
     
     # Relationships
@@ -72,6 +128,22 @@ class DBGameCharacter(Base):
 def init_db():
     """Initialize the database, creating tables if they don't exist"""
     Base.metadata.create_all(bind=engine)
+    _add_missing_columns()
+
+
+def _add_missing_columns():
+    """
+    create_all doesn't alter tables that already exist, so add the nullable
+    columns introduced since a table was created
+    """
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
 
 
 def get_db():
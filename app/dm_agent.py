@@ -2,14 +2,140 @@
 DM Agent using LangChain
 This agent acts as the Dungeon Master for the game.
 """
-from typing import List, Dict, Any, Optional
-from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from typing import List, Dict, Any, Optional, Callable, AsyncIterator, Tuple, Final, TYPE_CHECKING
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from types import MappingProxyType
+from langchain_core.messages import BaseMessage, SystemMessage, HumanMessage, AIMessage, ToolMessage
 from langchain_core.tools import tool
-from langchain_openai import ChatOpenAI
-from .models import Character
+from .models import VALID_ATTRIBUTES, VALID_ATTRIBUTE_SET, XP_PER_LEVEL
+import asyncio
+import inspect
 import os
-import json
 import random
+import orjson
+import hashlib
+import logging
+import re
+import threading
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+# OpenAI-compatible endpoint serving the DM model (GitHub Models)
+MODEL_BASE_URL = "https://models.inference.ai.azure.com"
+# Minimum number of history events replayed to the LLM
+HISTORY_WINDOW = 10
+# The start of the replayed window only advances in steps of this many events,
+# so the same history prefix is sent for several turns in a row
+HISTORY_CACHE_BUFFER = 10
+# Shared stand-in for events without a payload, so none is allocated per event
+_EMPTY_PAYLOAD = MappingProxyType({})
+# Number of LLM responses kept in the DM agent's local response cache
+RESPONSE_CACHE_SIZE = 1024
+# Player requests that usually make the DM call a tool; these bypass the response cache
+_TOOL_HINTS = re.compile(r"\b(roll\w*|dice|d\d+|attack\w*|level\w*|xp|experience\w*|creat\w*|character\w*)\b", re.IGNORECASE)
+# Number of games whose rendered history messages the DM agent keeps
+HISTORY_CACHE_GAMES = 256
+
+
+def history_window_start(history_length: int) -> int:
+    """
+    Index of the first history event replayed to the LLM.
+    
+    Unlike a plain history[-HISTORY_WINDOW:] slice, which drops the oldest event on
+    every turn, the start index is aligned to HISTORY_CACHE_BUFFER so it only moves
+    once every few turns. Between those moves the replayed events form a stable prefix.
+    """
+    return max(0, (history_length - HISTORY_WINDOW) // HISTORY_CACHE_BUFFER * HISTORY_CACHE_BUFFER)
+
+
+def _history_window(history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Return the tail of the game history to replay to the LLM.
+    Idempotent: a history that is already a window comes back whole.
+    """
+    return history[history_window_start(len(history)):]
+
+
+def _normalize_player_id(player_id: Any) -> str:
+    """Render player ids identically every time, so replayed history stays byte-stable"""
+    return str(player_id).strip().lower()
+
+
+def _render_event(event: Dict[str, Any]) -> Optional[BaseMessage]:
+    """Turn a history event into the chat message replayed to the LLM"""
+    event_type = event.get("type")
+    payload = event.get("payload") or _EMPTY_PAYLOAD
+    if event_type == "player_message":
+        pid = _normalize_player_id(payload.get("player_id", "Unknown"))
+        msg = payload.get("message", "")
+        return HumanMessage(content=f"Player {pid}: {msg}")
+    elif event_type == "dm_response":
+        return AIMessage(content=payload.get("message", ""))
+    return None
+
+
+def _log_usage(response: Optional[BaseMessage]):
+    """Log token usage of an LLM call, including how much of the prompt the provider served from its cache"""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        cached = (usage.get("input_token_details") or {}).get("cache_read", 0)
+        logger.debug(f"LLM usage: {usage.get('input_tokens', 0)} input tokens ({cached} cached), {usage.get('output_tokens', 0)} output tokens")
+
+
+def _cache_key(player_message: str, messages: List[BaseMessage]) -> Optional[str]:
+    """
+    Hash the role and content of every message into a response cache key.
+    
+    Returns None for player messages that are likely to need a tool (dice, XP, level
+    ups, character creation): a cached narrative must never stand in for those.
+    """
+    if _TOOL_HINTS.search(player_message):
+        return None
+    payload = orjson.dumps([(m.type, m.content) for m in messages])
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def _dumps(data: Any) -> str:
+    """Serialize a tool result for the LLM"""
+    return orjson.dumps(data).decode()
+
+
+# Dice the DM may roll, mapped to their faces; each face list is built once
+VALID_DICE = {
+    "d4": 4, "d6": 6, "d8": 8, "d10": 10, 
+    "d12": 12, "d20": 20, "d100": 100
+}
+_DICE_FACES = {dice: range(1, sides + 1) for dice, sides in VALID_DICE.items()}
+_rng = random.Random()
+_INVALID_DICE_ERROR = {"error": f"Invalid dice type. Choose from: {', '.join(VALID_DICE.keys())}"}
+_INVALID_COUNT_ERROR = {"error": "Count must be between 1 and 20"}
+
+_INVALID_ATTRIBUTE_ERROR = {"error": f"Invalid attribute. Choose from: {', '.join(VALID_ATTRIBUTES)}"}
+
+
+def _roll_dice_impl(dice_type: str, count: int = 1) -> Dict[str, Any]:
+    """Roll dice and return the result as a dict (see roll_dice)"""
+    dice_type_lower = dice_type.lower()
+    faces = _DICE_FACES.get(dice_type_lower)
+    if faces is None:
+        return _INVALID_DICE_ERROR
+    
+    if count < 1 or count > 20:
+        return _INVALID_COUNT_ERROR
+    
+    # One C-level call draws all dice instead of a randint() per die
+    rolls = _rng.choices(faces, k=count)
+    
+    return {
+        "dice_type": dice_type_lower,
+        "count": count,
+        "rolls": rolls,
+        "total": sum(rolls)
+    }
 
 
 @tool
@@ -25,27 +151,41 @@ def roll_dice(dice_type: str, count: int = 1) -> str:
     Returns:
         JSON with individual rolls, total, and dice type
     """
-    valid_dice = {
-        "d4": 4, "d6": 6, "d8": 8, "d10": 10, 
-        "d12": 12, "d20": 20, "d100": 100
+    return _dumps(_roll_dice_impl(dice_type, count))
+
+
+# Hit points of a new character before adding constitution
+BASE_HP = 10
+# Fields every new character starts with
+_CHAR_DEFAULTS = MappingProxyType({"level": 1, "experience": 0})
+
+
+def _create_character_impl(
+    name: str,
+    class_type: str,
+    strength: int = 10,
+    dexterity: int = 10,
+    constitution: int = 10,
+    intelligence: int = 10,
+    wisdom: int = 10,
+    charisma: int = 10,
+    backstory: str = ""
+) -> Dict[str, Any]:
+    """Build a character sheet as a dict (see create_character)"""
+    base_hp = BASE_HP + constitution
+    return _CHAR_DEFAULTS | {
+        "name": name,
+        "class_type": class_type,
+        "strength": strength,
+        "dexterity": dexterity,
+        "constitution": constitution,
+        "intelligence": intelligence,
+        "wisdom": wisdom,
+        "charisma": charisma,
+        "hit_points": base_hp,
+        "max_hit_points": base_hp,
+        "backstory": backstory
     }
-    
-    dice_type_lower = dice_type.lower()
-    if dice_type_lower not in valid_dice:
-        return json.dumps({"error": f"Invalid dice type. Choose from: {', '.join(valid_dice.keys())}"})
-    
-    if count < 1 or count > 20:
-        return json.dumps({"error": "Count must be between 1 and 20"})
-    
-    sides = valid_dice[dice_type_lower]
-    rolls = [random.randint(1, sides) for _ in range(count)]
-    
-    return json.dumps({
-        "dice_type": dice_type_lower,
-        "count": count,
-        "rolls": rolls,
-        "total": sum(rolls)
-    })
 
 
 @tool
@@ -77,23 +217,15 @@ def create_character(
     Returns:
         JSON string with character details
     """
-    base_hp = 10 + constitution
-    character = {
-        "name": name,
-        "class_type": class_type,
-        "level": 1,
-        "experience": 0,
-        "strength": strength,
-        "dexterity": dexterity,
-        "constitution": constitution,
-        "intelligence": intelligence,
-        "wisdom": wisdom,
-        "charisma": charisma,
-        "hit_points": base_hp,
-        "max_hit_points": base_hp,
-        "backstory": backstory
-    }
-    return json.dumps(character)
+    return _dumps(_create_character_impl(
+        name, class_type, strength, dexterity, constitution,
+        intelligence, wisdom, charisma, backstory
+    ))
+
+
+def _grant_experience_impl(amount: int, reason: str = "") -> Dict[str, Any]:
+    """Describe an experience grant as a dict (see grant_experience)"""
+    return {"experience": amount, "reason": reason}
 
 
 @tool
@@ -109,57 +241,143 @@ def grant_experience(amount: int, reason: str = "") -> str:
     Returns:
         JSON with experience granted and reason
     """
-    return json.dumps({"experience": amount, "reason": reason})
+    return _dumps(_grant_experience_impl(amount, reason))
 
 
-@tool
-def level_up_character(
-    attribute_to_increase: str,
-    hp_increase: int = 5
-) -> str:
-    """
+def _level_up_character_impl(attribute_to_increase: str, hp_increase: int = 5) -> Dict[str, Any]:
+    """Describe a level up as a dict (see level_up_character)"""
+    attribute = attribute_to_increase.lower()
+    if attribute not in VALID_ATTRIBUTE_SET:
+        return _INVALID_ATTRIBUTE_ERROR
+    
+    return {
+        "level_up": True,
+        "attribute_increased": attribute,
+        "hp_increase": hp_increase
+    }
+
+
+# Built from the game rules so the tool description can't drift from them
+_LEVEL_UP_DESCRIPTION = inspect.cleandoc(f"""
     Level up a character when they have enough experience.
-    Experience needed: 100 * current_level
+    Experience needed: {XP_PER_LEVEL} * current_level
     
     Args:
-        attribute_to_increase: Which attribute to increase (strength, dexterity, constitution, intelligence, wisdom, charisma)
+        attribute_to_increase: Which attribute to increase ({', '.join(VALID_ATTRIBUTES)})
         hp_increase: How much to increase max HP (default 5)
     
     Returns:
         JSON with level up details
+""")
+
+
+@tool(description=_LEVEL_UP_DESCRIPTION)
+def level_up_character(
+    attribute_to_increase: str,
+    hp_increase: int = 5
+) -> str:
+    return _dumps(_level_up_character_impl(attribute_to_increase, hp_increase))
+
+
+def _call_tool_impl(tool_obj, impl, args: Dict[str, Any]) -> Dict[str, Any]:
     """
-    valid_attributes = ["strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma"]
-    if attribute_to_increase.lower() not in valid_attributes:
-        return json.dumps({"error": f"Invalid attribute. Choose from: {', '.join(valid_attributes)}"})
+    Run a tool's plain implementation with the arguments requested by the LLM.
     
-    return json.dumps({
-        "level_up": True,
-        "attribute_increased": attribute_to_increase.lower(),
-        "hp_increase": hp_increase
-    })
+    The arguments still go through the tool's schema for type coercion and defaults,
+    but the result stays a dict instead of being serialized and parsed again.
+    """
+    return impl(**tool_obj.args_schema.model_validate(args).model_dump())
 
 
-class DMAgent:
-    """Dungeon Master agent powered by LangChain"""
+@dataclass(slots=True)
+class DMResult:
+    """Outcome of one DM turn: the narrative plus any effects requested through tools"""
+    message: str = ""
+    character: Optional[Dict[str, Any]] = None  # Sheet of a newly created character
+    experience: Optional[int] = None
+    level_up: bool = False
+    attribute_increased: Optional[str] = None
+    hp_increase: int = 0
+    level_up_available: bool = False  # Set by the game when granted XP reaches the next level
+
+
+def _handle_create_character(args: Dict[str, Any], result: DMResult) -> Dict[str, Any]:
+    tool_data = _call_tool_impl(create_character, _create_character_impl, args)
+    result.character = tool_data
+    return tool_data
+
+
+def _handle_grant_experience(args: Dict[str, Any], result: DMResult) -> Dict[str, Any]:
+    tool_data = _call_tool_impl(grant_experience, _grant_experience_impl, args)
+    result.experience = tool_data["experience"]
+    return tool_data
+
+
+def _handle_level_up(args: Dict[str, Any], result: DMResult) -> Dict[str, Any]:
+    tool_data = _call_tool_impl(level_up_character, _level_up_character_impl, args)
+    if "error" not in tool_data:
+        result.level_up = True
+        result.attribute_increased = tool_data["attribute_increased"]
+        result.hp_increase = tool_data["hp_increase"]
+    return tool_data
+
+
+def _handle_roll_dice(args: Dict[str, Any], result: DMResult) -> Dict[str, Any]:
+    return _call_tool_impl(roll_dice, _roll_dice_impl, args)
+
+
+# Tool name -> handler that runs the tool, records its effect in the DMResult
+# and returns the data to send back to the LLM
+_TOOL_HANDLERS: Dict[str, Callable[[Dict[str, Any], DMResult], Dict[str, Any]]] = {
+    "create_character": _handle_create_character,
+    "grant_experience": _handle_grant_experience,
+    "level_up_character": _handle_level_up,
+    "roll_dice": _handle_roll_dice,
+}
+
+_http_clients: Optional[Tuple["httpx.Client", "httpx.AsyncClient"]] = None
+_http_clients_lock = threading.Lock()
+
+
+def _shared_http_clients() -> Tuple["httpx.Client", "httpx.AsyncClient"]:
+    """
+    HTTP clients shared by every DMAgent.
     
-    def __init__(self, model_name: str = "gpt-4o-mini"):
-        """
-        Initialize the DM agent.
-        
-        Args:
-            model_name: The model to use (default: gpt-4o-mini)
-        """
-        self.llm = ChatOpenAI(
-            model=model_name,
-            temperature=0.7,
-            api_key=os.getenv("GITHUB_TOKEN"),
-            base_url="https://models.inference.ai.azure.com"
-        )
-        
-        # Bind tools to the LLM
-        self.llm_with_tools = self.llm.bind_tools([create_character, grant_experience, level_up_character, roll_dice])
-        
-        self.system_prompt = """You are a creative and engaging Dungeon Master for a text-based D&D-style role-playing game.
+    Keep-alive HTTP/2 pools: the TLS handshake is paid once and concurrent LLM
+    requests are multiplexed over the same connection.
+    """
+    global _http_clients
+    if _http_clients is None:
+        # Double-checked like get_dm_agent, so concurrent first calls open only one pool
+        with _http_clients_lock:
+            if _http_clients is None:
+                import httpx
+                
+                limits = httpx.Limits(max_keepalive_connections=50, max_connections=100)
+                timeout = httpx.Timeout(30.0, connect=5.0)
+                _http_clients = (
+                    httpx.Client(http2=True, limits=limits, timeout=timeout),
+                    httpx.AsyncClient(http2=True, limits=limits, timeout=timeout),
+                )
+    return _http_clients
+
+
+async def close_http_clients():
+    """Close the shared HTTP clients and their connections, e.g. on application shutdown"""
+    global _http_clients
+    with _http_clients_lock:
+        clients, _http_clients = _http_clients, None
+    if clients is not None:
+        client, async_client = clients
+        client.close()
+        await async_client.aclose()
+
+
+# Tools offered to the LLM, in a fixed order so the bound tool schemas are identical on every call
+DM_TOOLS = [create_character, grant_experience, level_up_character, roll_dice]
+
+# Kept byte-stable across calls so the provider can reuse its prompt prefix cache
+SYSTEM_PROMPT: Final[str] = f"""You are a creative and engaging Dungeon Master for a text-based D&D-style role-playing game.
 
 Your role is to:
 - Create an immersive fantasy adventure experience
@@ -175,7 +393,7 @@ Your role is to:
 EXPERIENCE & LEVELING:
 - Grant experience using grant_experience tool when players defeat enemies, solve puzzles, or complete quests
 - Typical experience rewards: minor encounter (10-30 XP), significant encounter (50-100 XP), major victory (150-300 XP)
-- Players level up when experience >= 100 * current_level
+- Players level up when experience >= {XP_PER_LEVEL} * current_level
 - IMPORTANT: First grant XP, then check if they can level up. The system will apply XP before checking level up requirements.
 - When player has enough total XP to level up (after granting new XP), use level_up_character tool
 - Let the player choose which attribute to increase when leveling up
@@ -192,24 +410,104 @@ DICE ROLLING:
 IMPORTANT: If a player hasn't created a character yet, guide them through character creation first before starting the adventure.
 
 Always respond in-character as the DM narrating the story."""
+
+# The system prompt never changes, so its message is built once and shared by every call
+_SYSTEM_MESSAGE = SystemMessage(content=SYSTEM_PROMPT)
+
+
+class DMAgent:
+    """Dungeon Master agent powered by LangChain"""
+
+    system_prompt = SYSTEM_PROMPT
     
-    def get_response(self, player_message: str, game_state: Dict[str, Any]) -> Dict[str, Any]:
+    def __init__(self, model_name: str = "gpt-4o-mini"):
         """
-        Generate a DM response to a player's message.
+        Initialize the DM agent.
         
         Args:
-            player_message: The player's current message
-            game_state: Complete game state including history and characters
-        
-        Returns:
-            Dict with 'message' and optionally 'character' if one was created
+            model_name: The model to use (default: gpt-4o-mini)
         """
+        # Imported here because langchain_openai (and the openai SDK) take most of a second
+        # to import; this way the cost is paid when the agent is first needed, not at startup
+        from langchain_openai import ChatOpenAI
+        
+        self._http_client, self._http_async_client = _shared_http_clients()
+        
+        self.llm = ChatOpenAI(
+            model=model_name,
+            temperature=0.7,
+            api_key=os.getenv("GITHUB_TOKEN"),
+            base_url=MODEL_BASE_URL,
+            http_client=self._http_client,
+            http_async_client=self._http_async_client,
+            stream_usage=True  # report token usage, including cached prompt tokens, when streaming
+        )
+        
+        # Bind tools to the LLM
+        self.llm_with_tools = self.llm.bind_tools(DM_TOOLS)
+        
+        # LRU cache of plain narrative responses, keyed on the full message list
+        self._response_cache: "OrderedDict[str, DMResult]" = OrderedDict()
+        # LRU of game_id -> {event id: message}, so each history event is rendered only once
+        self._history_cache: "OrderedDict[str, Dict[str, BaseMessage]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+    
+    def _get_cached_response(self, key: Optional[str]) -> Optional[DMResult]:
+        """Return a copy of a cached result, marking it as recently used"""
+        with self._cache_lock:
+            cached = self._response_cache.get(key) if key is not None else None
+            if cached is None:
+                return None
+            self._response_cache.move_to_end(key)
+            return replace(cached)
+    
+    def _cache_response(self, key: Optional[str], result: DMResult):
+        """Store a result in the response cache, evicting the least recently used entry"""
+        if key is None:
+            return
+        with self._cache_lock:
+            self._response_cache[key] = replace(result)
+            self._response_cache.move_to_end(key)
+            if len(self._response_cache) > RESPONSE_CACHE_SIZE:
+                self._response_cache.popitem(last=False)
+    
+    async def warm_up(self):
+        """Open a connection to the model endpoint ahead of the first LLM call"""
+        await self._http_async_client.get(MODEL_BASE_URL)
+    
+    def _build_messages(self, player_message: str, game_state: Dict[str, Any]) -> List[BaseMessage]:
+        """Assemble the prompt for a player's message: system prompt, history, player status, message"""
         player_id = game_state.get("current_player_id", "unknown")
         has_character = game_state.get("characters", {}).get(player_id) is not None
         game_history = game_state.get("history", [])
         
-        # Build message history for context
-        messages = [SystemMessage(content=self.system_prompt)]
+        # Build message history for context. The system prompt and replayed history
+        # come first so that prefix stays identical between turns; per-turn state goes last.
+        messages = [_SYSTEM_MESSAGE]
+        
+        # Add recent game history, reusing the messages rendered on earlier turns
+        game_id = game_state.get("game_id")
+        with self._cache_lock:
+            rendered = self._history_cache.get(game_id, {}) if game_id else {}
+        window_messages = {}
+        for event in _history_window(game_history):
+            event_id = event.get("id")
+            message = rendered.get(event_id) if event_id is not None else None
+            if message is None:
+                message = _render_event(event)
+                if message is None:
+                    continue
+            messages.append(message)
+            if event_id is not None:
+                window_messages[event_id] = message
+        
+        # Keep only the current window, dropping events that have slid out of it
+        if game_id:
+            with self._cache_lock:
+                self._history_cache[game_id] = window_messages
+                self._history_cache.move_to_end(game_id)
+                if len(self._history_cache) > HISTORY_CACHE_GAMES:
+                    self._history_cache.popitem(last=False)
         
         # Add character status context
         if not has_character:
@@ -218,75 +516,137 @@ Always respond in-character as the DM narrating the story."""
             char = game_state.get("characters", {}).get(player_id, {})
             messages.append(SystemMessage(content=f"IMPORTANT: Player {player_id} already has a character: {char.get('name', 'Unknown')}, a level {char.get('level', 1)} {char.get('class_type', 'Unknown')} with {char.get('experience', 0)} XP. DO NOT create a new character. Begin or continue their adventure."))
         
-        # Add recent game history (last 10 events for context)
-        for event in game_history[-10:]:
-            if event.get("type") == "player_message":
-                pid = event.get("payload", {}).get("player_id", "Unknown")
-                msg = event.get("payload", {}).get("message", "")
-                messages.append(HumanMessage(content=f"Player {pid}: {msg}"))
-            elif event.get("type") == "dm_response":
-                msg = event.get("payload", {}).get("message", "")
-                messages.append(AIMessage(content=msg))
-        
         # Add current player message
         messages.append(HumanMessage(content=player_message))
         
-        # Get response from LLM with tools
-        response = self.llm_with_tools.invoke(messages)
+        return messages
+    
+    def _run_tool_calls(self, response: AIMessage, messages: List[BaseMessage], result: DMResult):
+        """
+        Execute the tool calls requested by the LLM.
         
-        result = {"message": response.content or ""}
+        Appends the tool-calling response and one ToolMessage per call to messages,
+        and records the effect of each tool (character, experience, level up) in result.
+        """
+        messages.append(response)
         
-        # Check if tools were called
-        if hasattr(response, "tool_calls") and response.tool_calls:
-            # Add the AI response with tool calls to messages
-            messages.append(response)
+        # Execute all tool calls and add tool messages
+        for tool_call in response.tool_calls:
+            handler = _TOOL_HANDLERS.get(tool_call["name"])
+            if handler is None:
+                continue
             
-            # Execute all tool calls and add tool messages
-            for tool_call in response.tool_calls:
-                tool_name = tool_call["name"]
-                tool_call_id = tool_call["id"]
-                tool_output = None
-                
-                if tool_name == "create_character":
-                    # Execute the tool
-                    char_json = create_character.invoke(tool_call["args"])
-                    result["character"] = json.loads(char_json)
-                    tool_output = char_json
-                
-                elif tool_name == "grant_experience":
-                    xp_data = json.loads(grant_experience.invoke(tool_call["args"]))
-                    result["experience"] = xp_data["experience"]
-                    tool_output = json.dumps(xp_data)
-                
-                elif tool_name == "level_up_character":
-                    levelup_data = json.loads(level_up_character.invoke(tool_call["args"]))
-                    if "error" not in levelup_data:
-                        result["level_up"] = True
-                        result["attribute_increased"] = levelup_data["attribute_increased"]
-                        result["hp_increase"] = levelup_data["hp_increase"]
-                    tool_output = json.dumps(levelup_data)
-                
-                elif tool_name == "roll_dice":
-                    dice_data = json.loads(roll_dice.invoke(tool_call["args"]))
-                    tool_output = json.dumps(dice_data)
-                
-                # Add tool message with the result
-                if tool_output:
-                    messages.append(ToolMessage(content=tool_output, tool_call_id=tool_call_id))
+            tool_data = handler(tool_call["args"], result)
             
-            # Get the final narrative response from the LLM
-            final_response = self.llm_with_tools.invoke(messages)
-            result["message"] = final_response.content or "Something interesting happened..."
+            # Add tool message with the result
+            if tool_data:
+                messages.append(ToolMessage(content=_dumps(tool_data), tool_call_id=tool_call["id"]))
+    
+    async def aget_response(self, player_message: str, game_state: Dict[str, Any]) -> DMResult:
+        """
+        Generate a DM response to a player's message.
+        
+        Runs the same flow as astream_response, collecting the streamed text, so the
+        caching and tool handling live in one place.
         
+        Args:
+            player_message: The player's current message
+            game_state: Game state with the history window and the current player's character
+        
+        Returns:
+            DMResult with the narrative message and the effects of any tool calls
+        """
+        result = DMResult()
+        async for _ in self.astream_response(player_message, game_state, result):
+            pass
         return result
+    
+    async def astream_response(self, player_message: str, game_state: Dict[str, Any], result: DMResult) -> AsyncIterator[str]:
+        """
+        Generate a DM response to a player's message, yielding narrative text as it is generated.
+        
+        Args:
+            player_message: The player's current message
+            game_state: Game state with the history window and the current player's character
+            result: Filled in with the complete turn once the stream is exhausted
+        
+        Yields:
+            Chunks of the DM's narrative text
+        """
+        messages = self._build_messages(player_message, game_state)
+        
+        # Identical prompts can reuse an earlier narrative response
+        cache_key = _cache_key(player_message, messages)
+        cached = self._get_cached_response(cache_key)
+        if cached is not None:
+            result.message = cached.message
+            yield cached.message
+            return
+        
+        # Stream the first call, collecting the chunks to find out whether it asked for tools.
+        # Everything sent to the client is kept in streamed, so the stored message
+        # matches what the player saw, including any text before the tool calls.
+        streamed = []
+        response = None
+        async for chunk in self.llm_with_tools.astream(messages):
+            response = chunk if response is None else response + chunk
+            if chunk.content:
+                streamed.append(chunk.content)
+                yield chunk.content
+        _log_usage(response)
+        
+        if response is not None and response.tool_calls:
+            self._run_tool_calls(response, messages, result)
+            
+            # Stream the final narrative response, set apart from any text the first call
+            # streamed before its tool calls
+            separator = "\n\n" if streamed else ""
+            has_final_text = False
+            final_response = None
+            async for chunk in self.llm_with_tools.astream(messages):
+                final_response = chunk if final_response is None else final_response + chunk
+                if chunk.content:
+                    if not has_final_text and separator:
+                        streamed.append(separator)
+                        yield separator
+                    has_final_text = True
+                    streamed.append(chunk.content)
+                    yield chunk.content
+            _log_usage(final_response)
+            
+            if not has_final_text:
+                if separator:
+                    streamed.append(separator)
+                    yield separator
+                streamed.append("Something interesting happened...")
+                yield streamed[-1]
+            result.message = "".join(streamed)
+        else:
+            result.message = "".join(streamed)
+            # Only responses without tool calls are cached: every tool either changes
+            # game state or rolls dice, so replaying those would be wrong
+            self._cache_response(cache_key, result)
 
 
 # Singleton instance
 _dm_agent = None
+_dm_agent_lock = threading.Lock()
 
 def get_dm_agent() -> DMAgent:
     """Get or create the singleton DM agent instance"""
     global _dm_agent
     if _dm_agent is None:
-        _dm_agent = DMAgent()
+        # Double-checked so concurrent first requests still build only one LLM client
+        with _dm_agent_lock:
+            if _dm_agent is None:
+                _dm_agent = DMAgent()
     return _dm_agent
+
+
+async def warm_up_dm_agent():
+    """Create the DM agent and open its LLM connection, e.g. in the background at startup"""
+    try:
+        agent = await asyncio.to_thread(get_dm_agent)
+        await agent.warm_up()
+    except Exception as e:
+        logger.warning(f"DM agent warm-up failed: {e}")
@@ -1,8 +1,16 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from typing import List, Optional, Dict, Any
 from uuid import uuid4
 
 
+# Experience needed per level: reaching level n+1 takes XP_PER_LEVEL * n
+XP_PER_LEVEL = 100
+
+# Attributes a level up may increase
+VALID_ATTRIBUTES = ("strength", "dexterity", "constitution", "intelligence", "wisdom", "charisma")
+VALID_ATTRIBUTE_SET = frozenset(VALID_ATTRIBUTES)
+
+
 class Player(BaseModel):
     id: str
     name: str
@@ -10,6 +18,8 @@ class Player(BaseModel):
 
 class Character(BaseModel):
     """D&D style character sheet"""
+    model_config = ConfigDict(defer_build=True)
+
     name: str
     class_type: str  # Warrior, Mage, Rogue, Cleric, etc.
     level: int = 1
@@ -24,6 +34,34 @@ class Character(BaseModel):
     max_hit_points: int = 10
     backstory: Optional[str] = None
 
+    @property
+    def xp_needed(self) -> int:
+        """Experience needed to reach the next level"""
+        return XP_PER_LEVEL * self.level
+
+    def grant_xp(self, amount: int) -> bool:
+        """Add experience. Returns True if the character now has enough to level up."""
+        self.experience += amount
+        return self.experience >= self.xp_needed
+
+    def try_level_up(self, hp_increase: int, attribute: Optional[str] = None) -> bool:
+        """
+        Level up if the character has enough experience: spend it, raise max HP
+        (restoring HP to full) and increase the given attribute by one.
+        Only names in VALID_ATTRIBUTES are increased; anything else is ignored.
+        Returns False, changing nothing, if there isn't enough experience.
+        """
+        xp_needed = self.xp_needed
+        if self.experience < xp_needed:
+            return False
+        self.experience -= xp_needed
+        self.level += 1
+        self.max_hit_points += hp_increase
+        self.hit_points = self.max_hit_points
+        if attribute in VALID_ATTRIBUTE_SET:
+            setattr(self, attribute, getattr(self, attribute) + 1)
+        return True
+
 
 class Action(BaseModel):
     player_id: str
@@ -31,12 +69,17 @@ class Action(BaseModel):
 
 
 class Event(BaseModel):
+    # Events are append-only: once logged they are never changed
+    model_config = ConfigDict(defer_build=True, frozen=True)
+
     id: str
     type: str
     payload: Dict[str, Any]
 
 
 class GameState(BaseModel):
+    model_config = ConfigDict(defer_build=True)
+
     game_id: str
     players: List[Player] = []
     characters: Dict[str, Optional[Character]] = {}  # player_id -> Character
@@ -1,9 +1,13 @@
 """
-Persistence layer for storing and retrieving game data and characters
+Persistence layer for storing and retrieving game data and characters.
+
+Write functions don't commit: the caller owns the transaction, so one player
+action can be persisted with a single commit.
 """
-from typing import Optional, List, Dict
-from sqlalchemy.orm import Session
-from .database import DBGame, DBCharacter, DBGameCharacter
+from typing import Optional, List, Dict, Any
+from sqlalchemy import func, update
+from sqlalchemy.orm import Session, joinedload
+from .database import DBGame, DBCharacter, DBGameCharacter, DBGameEvent
 from .models import GameState, Character, Player, Event
 from uuid import uuid4
 
@@ -32,29 +36,20 @@ def save_character(db: Session, character: Character, player_name: str) -> str:
         backstory=character.backstory
     )
     db.add(db_char)
-    db.commit()
-    db.refresh(db_char)
-    return db_char.id
+    # Emit the INSERT now so mappings written in the same transaction can reference it.
+    # The id is generated here, so there is nothing to read back.
+    db.flush()
+    return char_id
 
 
 def update_character(db: Session, character_id: str, character: Character):
     """Update an existing character in the database"""
-    db_char = db.query(DBCharacter).filter(DBCharacter.id == character_id).first()
-    if db_char:
-        db_char.name = character.name
-        db_char.class_type = character.class_type
-        db_char.level = character.level
-        db_char.experience = character.experience
-        db_char.strength = character.strength
-        db_char.dexterity = character.dexterity
-        db_char.constitution = character.constitution
-        db_char.intelligence = character.intelligence
-        db_char.wisdom = character.wisdom
-        db_char.charisma = character.charisma
-        db_char.hit_points = character.hit_points
-        db_char.max_hit_points = character.max_hit_points
-        db_char.backstory = character.backstory
-        db.commit()
+    # Single UPDATE; Character fields map one-to-one onto DBCharacter columns
+    db.execute(
+        update(DBCharacter)
+        .where(DBCharacter.id == character_id)
+        .values(**character.model_dump())
+    )
 
 
 def get_character(db: Session, character_id: str) -> Optional[Character]:
@@ -63,7 +58,12 @@ def get_character(db: Session, character_id: str) -> Optional[Character]:
     if not db_char:
         return None
     
-    return Character(
+    return _to_character(db_char)
+
+
+def _to_character(db_char: DBCharacter) -> Character:
+    # Rows come from our own typed columns, so skip validation
+    return Character.model_construct(
         name=db_char.name,
         class_type=db_char.class_type,
         level=db_char.level,
@@ -82,68 +82,147 @@ def get_character(db: Session, character_id: str) -> Optional[Character]:
 
 def list_characters(db: Session, player_name: str) -> List[Dict]:
     """List all characters for a player"""
-    db_chars = db.query(DBCharacter).filter(DBCharacter.player_name == player_name).all()
+    # Select only the listed columns: skips the backstory text and ORM object hydration
+    rows = (
+        db.query(DBCharacter.id, DBCharacter.name, DBCharacter.class_type, DBCharacter.level, DBCharacter.created_at)
+        .filter(DBCharacter.player_name == player_name)
+        .all()
+    )
     return [
         {
-            "id": char.id,
-            "name": char.name,
-            "class_type": char.class_type,
-            "level": char.level,
-            "created_at": char.created_at.isoformat()
+            "id": char_id,
+            "name": name,
+            "class_type": class_type,
+            "level": level,
+            # Tables created before timestamps moved to the database have no column default
+            "created_at": created_at.isoformat() if created_at else None
         }
-        for char in db_chars
+        for char_id, name, class_type, level, created_at in rows
     ]
 
 
-def save_game(db: Session, game_state: GameState, character_mappings: Dict[str, str]):
+def save_game(db: Session, game_state: GameState, character_mappings: Optional[Dict[str, str]]):
     """
     Save game state to database.
-    character_mappings: dict of player_id -> character_id
+    character_mappings: dict of player_id -> character_id, or None if the mappings
+    haven't changed since the last save and don't need to be synced
     """
     # Save or update game
     db_game = db.query(DBGame).filter(DBGame.game_id == game_state.game_id).first()
     
-    logs_json = [
-        {
-            "id": log.id,
-            "type": log.type,
-            "payload": log.payload
-        }
-        for log in game_state.logs
-    ]
-    
     if db_game:
-        # Update existing
+        # Update existing; new events are appended separately through batched_game
         db_game.turn_index = game_state.turn_index
-        db_game.logs = logs_json
         db_game.meta = game_state.meta
+        db_game.players = _player_rows(game_state)
+        # A turn often changes none of the columns above, so bump the activity time explicitly
+        db_game.updated_at = func.now()
     else:
         # Create new
         db_game = DBGame(
             game_id=game_state.game_id,
             turn_index=game_state.turn_index,
-            logs=logs_json,
-            meta=game_state.meta
+            meta=game_state.meta,
+            players=_player_rows(game_state)
         )
         db.add(db_game)
+        db.flush()  # the game row must exist before events and mappings reference it
+        if game_state.logs:
+            _insert_events(db, [_event_row(game_state.game_id, log) for log in game_state.logs])
+    
+    if character_mappings is None:
+        return
+    
+    # Update character mappings, touching only the rows that changed
+    wanted = {player_id: char_id for player_id, char_id in character_mappings.items() if char_id}
+    existing = db.query(DBGameCharacter).filter(DBGameCharacter.game_id == game_state.game_id).all()
+    for db_game_char in existing:
+        char_id = wanted.pop(db_game_char.player_id, None)
+        if char_id is None:
+            db.delete(db_game_char)
+        elif char_id != db_game_char.character_id:
+            db_game_char.character_id = char_id
+    
+    # Whatever is left in wanted is a new mapping
+    if wanted:
+        db.execute(
+            DBGameCharacter.__table__.insert(),
+            [
+                {"game_id": game_state.game_id, "character_id": char_id, "player_id": player_id}
+                for player_id, char_id in wanted.items()
+            ]
+        )
+
+
+def _player_rows(game_state: GameState) -> List[Dict[str, str]]:
+    return [{"id": player.id, "name": player.name} for player in game_state.players]
+
+
+class BatchedGameWriter:
+    """
+    Buffers events for a game and inserts them into game_events with a single executemany.
     
-    db.commit()
+    Usage:
+        with batched_game(db, game_id) as batch:
+            batch.append(player_event)
+            batch.append(dm_event)
+    """
+    
+    def __init__(self, db: Session, game_id: str):
+        self.db = db
+        self.game_id = game_id
+        self._events: List[Dict[str, Any]] = []
+    
+    def append(self, event: Event):
+        self._events.append(_event_row(self.game_id, event))
     
-    # Update character mappings
-    # Remove old mappings
-    db.query(DBGameCharacter).filter(DBGameCharacter.game_id == game_state.game_id).delete()
+    def flush(self):
+        """Insert all buffered events in one statement"""
+        if not self._events:
+            return
+        _insert_events(self.db, self._events)
+        self._events = []
     
-    # Add new mappings
-    for player_id, char_id in character_mappings.items():
-        if char_id:
-            db_game_char = DBGameCharacter(
-                game_id=game_state.game_id,
-                character_id=char_id,
-                player_id=player_id
-            )
-            db.add(db_game_char)
+    def __enter__(self) -> "BatchedGameWriter":
+        return self
     
-    db.commit()
+    def __exit__(self, exc_type, exc, tb):
+        # Drop the buffer if the caller failed part way through
+        if exc_type is None:
+            self.flush()
+        return False
+
+
+def batched_game(db: Session, game_id: str) -> BatchedGameWriter:
+    """Open a buffered event writer for a game"""
+    return BatchedGameWriter(db, game_id)
+
+
+def _event_row(game_id: str, event: Event) -> Dict[str, Any]:
+    return {
+        "game_id": game_id,
+        "seq": int(event.id),
+        "type": event.type,
+        "payload": event.payload
+    }
+
+
+def _insert_events(db: Session, rows: List[Dict[str, Any]]):
+    """
+    Insert event rows with a single Core executemany.
+    Events are append-only, so this skips the ORM unit of work entirely.
+    """
+    db.execute(DBGameEvent.__table__.insert(), rows)
+
+
+def load_character_mappings(db: Session, game_id: str) -> Dict[str, str]:
+    """Load the player_id -> character_id mappings of a game"""
+    rows = (
+        db.query(DBGameCharacter.player_id, DBGameCharacter.character_id)
+        .filter(DBGameCharacter.game_id == game_id)
+        .all()
+    )
+    return {player_id: character_id for player_id, character_id in rows}
 
 
 def load_game(db: Session, game_id: str) -> Optional[tuple[GameState, Dict[str, str]]]:
@@ -155,27 +234,50 @@ def load_game(db: Session, game_id: str) -> Optional[tuple[GameState, Dict[str,
     if not db_game:
         return None
     
-    # Load game characters
-    game_chars = db.query(DBGameCharacter).filter(DBGameCharacter.game_id == game_id).all()
+    # Load game characters together with their character rows in a single JOIN
+    game_chars = (
+        db.query(DBGameCharacter)
+        .options(joinedload(DBGameCharacter.character))
+        .filter(DBGameCharacter.game_id == game_id)
+        .all()
+    )
     
     # Build character mappings and load characters
     character_mappings = {}
     characters = {}
-    players = []
     
     for gc in game_chars:
         character_mappings[gc.player_id] = gc.character_id
-        char = get_character(db, gc.character_id)
-        characters[gc.player_id] = char
-        players.append(Player(id=gc.player_id, name=gc.character.player_name))
+        characters[gc.player_id] = _to_character(gc.character)
     
-    # Reconstruct events
+    if db_game.players is not None:
+        players = [Player.model_construct(id=p["id"], name=p["name"]) for p in db_game.players]
+    else:
+        # Games saved before the player list was stored only know the players with a character
+        players = [
+            Player.model_construct(id=gc.player_id, name=gc.character.player_name)
+            for gc in game_chars
+        ]
+    
+    # Reconstruct events. Games saved before game_events existed keep the start
+    # of their log in the legacy JSON column. Everything here was written by
+    # save_game from validated models, so it is constructed without revalidation.
     logs = [
-        Event(id=log["id"], type=log["type"], payload=log["payload"])
-        for log in db_game.logs
+        Event.model_construct(id=log["id"], type=log["type"], payload=log["payload"])
+        for log in db_game.logs or []
     ]
+    db_events = (
+        db.query(DBGameEvent)
+        .filter(DBGameEvent.game_id == game_id)
+        .order_by(DBGameEvent.seq)
+        .all()
+    )
+    logs.extend(
+        Event.model_construct(id=str(e.seq), type=e.type, payload=e.payload)
+        for e in db_events
+    )
     
-    game_state = GameState(
+    game_state = GameState.model_construct(
         game_id=db_game.game_id,
         players=players,
         characters=characters,
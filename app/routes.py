@@ -1,16 +1,30 @@
 from fastapi import APIRouter, HTTPException, Depends
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from typing import List, Optional
 from sqlalchemy.orm import Session
+from contextlib import aclosing
+import logging
+import orjson
 
 from .models import GameState, Player, Action
-from .store import create_game, get_game, apply_action
+from .store import create_game, get_game, apply_action, stream_action
 from .database import get_db
 from .persistence import list_characters, get_character, save_character
 from .models import Character
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(tags=["games"])
 
+# Endpoints that only touch the database are plain def: FastAPI runs them in its
+# threadpool, so blocking session work never stalls the event loop. The action
+# endpoints stay async and hand their database work to threads themselves.
+#
+# Routes declare their response model as the return type: FastAPI then serializes
+# the response straight to JSON bytes with Pydantic instead of walking it with
+# jsonable_encoder first.
+
 
 class CreateGameRequest(BaseModel):
     player_names: Optional[List[str]] = None
@@ -20,14 +34,39 @@ class SelectCharacterRequest(BaseModel):
     character_id: str
 
 
+class CreateGameResponse(BaseModel):
+    game_id: str
+    players: List[Player]
+
+
+class CharacterSummary(BaseModel):
+    id: str
+    name: str
+    class_type: str
+    level: int
+    created_at: Optional[str] = None
+
+
+class CharacterListResponse(BaseModel):
+    player_name: str
+    characters: List[CharacterSummary]
+
+
+class SelectCharacterResponse(BaseModel):
+    message: str
+    game_id: str
+    player_id: str
+    character: Character
+
+
 @router.post("/games")
-async def create_game_endpoint(body: CreateGameRequest):
+def create_game_endpoint(body: CreateGameRequest) -> CreateGameResponse:
     game = create_game(player_names=body.player_names)
-    return {"game_id": game.game_id, "players": [{"id": p.id, "name": p.name} for p in game.players]}
+    return CreateGameResponse(game_id=game.game_id, players=game.players)
 
 
 @router.get("/games/{game_id}")
-async def get_game_endpoint(game_id: str):
+def get_game_endpoint(game_id: str) -> GameState:
     game = get_game(game_id)
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
@@ -35,22 +74,50 @@ async def get_game_endpoint(game_id: str):
 
 
 @router.post("/games/{game_id}/action")
-async def post_action_endpoint(game_id: str, action: Action):
-    game = apply_action(game_id, action)
+async def post_action_endpoint(game_id: str, action: Action) -> GameState:
+    game = await apply_action(game_id, action)
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
     return game
 
 
+@router.post("/games/{game_id}/action/stream")
+async def stream_action_endpoint(game_id: str, action: Action):
+    """
+    Submit a player action and stream the DM's narrative back as Server-Sent Events.
+    Each event carries {"token": ...}; a final {"done": true} event follows once the turn is saved,
+    or an {"error": ...} event if the turn failed and was discarded.
+    """
+    chunks = await stream_action(game_id, action)
+    if chunks is None:
+        raise HTTPException(status_code=404, detail="Game not found")
+    
+    async def event_stream():
+        # Encoded once per token, so use orjson and write bytes directly.
+        # aclosing ends the turn (and releases the game) as soon as the client disconnects.
+        async with aclosing(chunks):
+            try:
+                async for chunk in chunks:
+                    yield b"data: " + orjson.dumps({"token": chunk}) + b"\n\n"
+            except Exception:
+                # The turn is discarded; tell the client instead of just ending the stream
+                logger.exception(f"Streaming action failed for game {game_id}")
+                yield b"data: " + orjson.dumps({"error": "The Dungeon Master could not respond. Please try again."}) + b"\n\n"
+                return
+        yield b"data: " + orjson.dumps({"done": True}) + b"\n\n"
+    
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+
 @router.get("/characters/{player_name}")
-async def list_characters_endpoint(player_name: str, db: Session = Depends(get_db)):
+def list_characters_endpoint(player_name: str, db: Session = Depends(get_db)) -> CharacterListResponse:
     """List all characters for a player"""
     characters = list_characters(db, player_name)
-    return {"player_name": player_name, "characters": characters}
+    return CharacterListResponse(player_name=player_name, characters=characters)
 
 
 @router.get("/characters/{player_name}/{character_id}")
-async def get_character_endpoint(player_name: str, character_id: str, db: Session = Depends(get_db)):
+def get_character_endpoint(player_name: str, character_id: str, db: Session = Depends(get_db)) -> Character:
     """Get detailed character information"""
     character = get_character(db, character_id)
     if not character:
@@ -59,12 +126,12 @@ async def get_character_endpoint(player_name: str, character_id: str, db: Sessio
 
 
 @router.post("/games/{game_id}/select-character/{player_id}")
-async def select_character_endpoint(
+def select_character_endpoint(
     game_id: str, 
     player_id: str, 
     body: SelectCharacterRequest,
     db: Session = Depends(get_db)
-):
+) -> SelectCharacterResponse:
     """
     Select/assign a character to a player in a game.
     This allows players to choose from their existing characters.
@@ -81,4 +148,4 @@ async def select_character_endpoint(
     if not game:
         raise HTTPException(status_code=404, detail="Game not found")
     
-    return {"message": "Character assigned", "game_id": game_id, "player_id": player_id, "character": character}
+    return SelectCharacterResponse(message="Character assigned", game_id=game_id, player_id=player_id, character=character)
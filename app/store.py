@@ -1,16 +1,66 @@
-from typing import Dict, Optional
+from typing import Dict, Optional, Any, Tuple, AsyncIterator
+from collections import OrderedDict
+import asyncio
 import logging
+import os
+import threading
+import weakref
 from .models import GameState, Player, Event, Character
-from .dm_agent import get_dm_agent
+from .dm_agent import get_dm_agent, history_window_start, DMResult
 from .database import SessionLocal
-from .persistence import save_game, load_game, save_character, update_character
+from .persistence import save_game, load_game, load_character_mappings, save_character, update_character, batched_game
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# In-memory cache for active games (backed by database)
-_games: Dict[str, GameState] = {}
-_character_mappings: Dict[str, Dict[str, str]] = {}  # game_id -> {player_id -> character_id}
+# Maximum number of games kept in memory
+GAME_CACHE_SIZE = int(os.getenv("GAME_CACHE_SIZE", "1024"))
+
+# In-memory LRU cache for active games (backed by database). Every turn is written
+# through to the database, so evicting a game never loses state.
+_games: "OrderedDict[str, GameState]" = OrderedDict()
+_character_mappings: Dict[str, Dict[str, str]] = {}  # game_id -> {player_id -> character_id}, same keys as _games
+_cache_lock = threading.Lock()
+
+
+def _cache_game(game: GameState, character_mappings: Dict[str, str]):
+    """Add or refresh a game in the cache, evicting the least recently used games"""
+    with _cache_lock:
+        _games[game.game_id] = game
+        _games.move_to_end(game.game_id)
+        _character_mappings[game.game_id] = character_mappings
+        while len(_games) > GAME_CACHE_SIZE:
+            evicted_id, _ = _games.popitem(last=False)
+            _character_mappings.pop(evicted_id, None)
+
+
+# One lock per game serializes its turns: a turn holds it from building the prompt
+# until its events are logged, so overlapping actions can't interleave. Locks are
+# dropped automatically once no turn is holding or waiting for them.
+_turn_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+
+
+def _turn_lock(game_id: str) -> asyncio.Lock:
+    lock = _turn_locks.get(game_id)
+    if lock is None:
+        lock = _turn_locks[game_id] = asyncio.Lock()
+    return lock
+
+
+def _evict_game(game_id: str):
+    """Drop a game from the cache, so the next access reloads it from the database"""
+    with _cache_lock:
+        _games.pop(game_id, None)
+        _character_mappings.pop(game_id, None)
+
+
+def _get_mappings(db, game_id: str) -> Dict[str, str]:
+    """Character mappings of a game, reloaded if the game was evicted while in use"""
+    with _cache_lock:
+        mappings = _character_mappings.get(game_id)
+    if mappings is None:
+        mappings = load_character_mappings(db, game_id)
+    return mappings
 
 
 def create_game(player_names: Optional[list] = None) -> GameState:
@@ -19,16 +69,12 @@ def create_game(player_names: Optional[list] = None) -> GameState:
         for i, name in enumerate(player_names):
             players.append(Player(id=str(i+1), name=name))
     game = GameState.create(players=players)
-    _games[game.game_id] = game
-    _character_mappings[game.game_id] = {}
     
     # Persist to database
-    db = SessionLocal()
-    try:
+    with SessionLocal() as db, db.begin():
         save_game(db, game, {})
-    finally:
-        db.close()
     
+    _cache_game(game, {})
     return game
 
 
@@ -43,25 +89,23 @@ def assign_character_to_game(game_id: str, player_id: str, character_id: str, ch
     # Assign character
     game.characters[player_id] = character
     
-    # Update mappings
-    if game_id not in _character_mappings:
-        _character_mappings[game_id] = {}
-    _character_mappings[game_id][player_id] = character_id
-    
-    # Persist to database
-    db = SessionLocal()
-    try:
-        save_game(db, game, _character_mappings[game_id])
-    finally:
-        db.close()
+    # Update mappings and persist to database
+    with SessionLocal() as db, db.begin():
+        mappings = _get_mappings(db, game_id)
+        mappings[player_id] = character_id
+        save_game(db, game, mappings)
     
+    _cache_game(game, mappings)
     return game
 
 
 def get_game(game_id: str) -> Optional[GameState]:
     # Check cache first
-    if game_id in _games:
-        return _games[game_id]
+    with _cache_lock:
+        game = _games.get(game_id)
+        if game is not None:
+            _games.move_to_end(game_id)
+            return game
     
     # Try loading from database
     db = SessionLocal()
@@ -69,8 +113,7 @@ def get_game(game_id: str) -> Optional[GameState]:
         result = load_game(db, game_id)
         if result:
             game_state, char_mappings = result
-            _games[game_id] = game_state
-            _character_mappings[game_id] = char_mappings
+            _cache_game(game_state, char_mappings)
             return game_state
     finally:
         db.close()
@@ -78,48 +121,106 @@ def get_game(game_id: str) -> Optional[GameState]:
     return None
 
 
-def apply_action(game_id: str, action) -> Optional[GameState]:
-    game = get_game(game_id)  # Use get_game instead of direct cache access
+async def apply_action(game_id: str, action) -> Optional[GameState]:
+    async with _turn_lock(game_id):
+        # Loading the game may hit the database, so keep it off the event loop. It is loaded
+        # under the lock, so a game evicted and reloaded meanwhile includes the previous turn.
+        game = await asyncio.to_thread(get_game, game_id)
+        if not game:
+            return None
+        
+        event, game_state_dict = _start_turn(game, action)
+        
+        # Get DM response using LangChain agent
+        dm_agent = get_dm_agent()
+        dm_result = await dm_agent.aget_response(action.message, game_state_dict)
+        
+        # Applying the result writes to the database, so run it in a worker thread as well
+        await asyncio.to_thread(_apply_dm_result, game, action, event, dm_result)
+    return game
+
+
+async def stream_action(game_id: str, action) -> Optional[AsyncIterator[str]]:
+    """
+    Like apply_action, but returns the DM's narrative as a stream of text chunks.
+    The turn is applied and persisted once the stream has been consumed.
+    """
+    game = await asyncio.to_thread(get_game, game_id)
     if not game:
         return None
+    
+    return _stream_turn(game, action)
+
+
+async def _stream_turn(game: GameState, action) -> AsyncIterator[str]:
+    # The turn starts when the stream is first read, so a stream that is never
+    # consumed doesn't hold the game's lock. If the stream fails or is closed early,
+    # nothing has been logged yet: the turn is discarded and doesn't advance.
+    async with _turn_lock(game.game_id):
+        # Look the game up again under the lock, in case it was evicted and reloaded meanwhile
+        game = await asyncio.to_thread(get_game, game.game_id) or game
+        event, game_state_dict = _start_turn(game, action)
+        dm_result = DMResult()
+        async for chunk in get_dm_agent().astream_response(action.message, game_state_dict, dm_result):
+            yield chunk
+        
+        await asyncio.to_thread(_apply_dm_result, game, action, event, dm_result)
+
 
-    # Log the player message as an event
-    event = Event(
+def _start_turn(game: GameState, action) -> Tuple[Event, Dict[str, Any]]:
+    """
+    Build the player's message event and the game state passed to the DM agent.
+    The event is only added to the log, together with the DM's reply, by
+    _apply_dm_result: a turn whose LLM call fails leaves no trace in the game.
+    """
+    # Events are built from trusted values, so model_construct skips Pydantic validation
+    event = Event.model_construct(
         id=str(len(game.logs)+1),
         type="player_message",
         payload={"player_id": action.player_id, "message": action.message}
     )
-    game.logs.append(event)
     
-    # Get DM response using LangChain agent
-    dm_agent = get_dm_agent()
-    
-    # Prepare game state for agent
+    # Prepare game state for agent. Only the events the agent will replay are
+    # serialized, so this stays O(window) however long the game log grows.
+    # Likewise only the acting player's character is dumped: the agent never reads the others.
+    char = game.characters.get(action.player_id)
     game_state_dict = {
+        "game_id": game.game_id,
         "current_player_id": action.player_id,
-        "characters": {
-            pid: char.model_dump() if char else None 
-            for pid, char in game.characters.items()
-        },
+        "characters": {action.player_id: char.model_dump() if char else None},
         "history": [
             {
+                "id": log.id,
                 "type": log.type,
                 "payload": log.payload
             }
-            for log in game.logs[:-1]  # Exclude the just-added player message
+            for log in game.logs[history_window_start(len(game.logs)):]
         ]
     }
     
-    dm_result = dm_agent.get_response(action.message, game_state_dict)
-    
-    logger.info(f"DM result keys: {dm_result.keys()}")
+    return event, game_state_dict
+
+
+def _apply_dm_result(game: GameState, action, event: Event, dm_result: DMResult):
+    """Apply the DM's response to the game state and persist the turn"""
+    try:
+        _apply_turn(game, action, event, dm_result)
+    except Exception:
+        # The cached game may already hold part of a turn the database never got.
+        # Saves only append, so a later turn wouldn't repair that: reload it instead.
+        _evict_game(game.game_id)
+        raise
+
+
+def _apply_turn(game: GameState, action, event: Event, dm_result: DMResult):
     logger.info(f"DM result: {dm_result}")
     logger.info(f"Game characters before processing: {list(game.characters.keys())}")
     logger.info(f"Current character XP before processing: {game.characters.get(action.player_id).experience if game.characters.get(action.player_id) else 'N/A'}")
     
-    # If a character was created, save it
-    if "character" in dm_result:
-        char_data = dm_result["character"]
+    # If a character was created, add it to the game; it is saved with the rest of the turn
+    created_char = None
+    if dm_result.character is not None:
+        char_data = dm_result.character
         new_char = Character(**char_data)
         
         # Check if player already has a character
@@ -127,104 +228,78 @@ def apply_action(game_id: str, action) -> Optional[GameState]:
             logger.warning(f"Player {action.player_id} already has a character! Not creating duplicate.")
         else:
             game.characters[action.player_id] = new_char
-            
-            # Save to database
-            db = SessionLocal()
-            try:
-                player_name = next((p.name for p in game.players if p.id == action.player_id), "Unknown")
-                char_id = save_character(db, new_char, player_name)
-                if game.game_id not in _character_mappings:
-                    _character_mappings[game.game_id] = {}
-                _character_mappings[game.game_id][action.player_id] = char_id
-                logger.info(f"Created new character {char_id} for player {action.player_id}")
-            finally:
-                db.close()
+            created_char = new_char
     
     # Track if character was modified
     character_modified = False
     
     # If experience was granted, update character
-    if "experience" in dm_result:
+    if dm_result.experience is not None:
         char = game.characters.get(action.player_id)
         if char:
-            logger.info(f"Granting {dm_result['experience']} XP to {char.name}. Current XP: {char.experience}")
-            char.experience += dm_result["experience"]
-            logger.info(f"New XP: {char.experience}")
+            logger.info(f"Granting {dm_result.experience} XP to {char.name}. Current XP: {char.experience}")
+            can_level_up = char.grant_xp(dm_result.experience)
+            logger.info(f"New XP: {char.experience}, XP needed for level {char.level + 1}: {char.xp_needed}")
             character_modified = True
             
-            # Check if character should level up automatically
-            xp_needed = 100 * char.level
-            logger.info(f"XP needed for level {char.level + 1}: {xp_needed}")
-            if char.experience >= xp_needed and "level_up" not in dm_result:
+            # Notify that level up is available if the DM didn't level the character up already
+            if can_level_up and not dm_result.level_up:
                 logger.info(f"Character has enough XP to level up! Creating level_up event.")
-                # Notify that level up is available
-                dm_result["level_up_available"] = True
+                dm_result.level_up_available = True
         else:
             logger.warning(f"No character found for player {action.player_id}")
     
     # If character leveled up, apply changes
-    if "level_up" in dm_result and dm_result["level_up"]:
+    if dm_result.level_up:
         char = game.characters.get(action.player_id)
         if char:
-            # Check if they have enough XP to level up
-            xp_needed = 100 * char.level
-            logger.info(f"Level up requested! Current level: {char.level}, XP: {char.experience}, XP needed: {xp_needed}")
-            if char.experience >= xp_needed:
-                char.experience -= xp_needed
-                char.level += 1
-                char.max_hit_points += dm_result.get("hp_increase", 5)
-                char.hit_points = char.max_hit_points  # Restore to full HP on level up
-                
-                # Increase chosen attribute
-                attr = dm_result.get("attribute_increased")
-                logger.info(f"Leveling up to {char.level}! Increasing {attr}, HP +{dm_result.get('hp_increase', 5)}")
-                if attr and hasattr(char, attr):
-                    current_val = getattr(char, attr)
-                    setattr(char, attr, current_val + 1)
-                    logger.info(f"{attr}: {current_val} -> {current_val + 1}")
-                
+            logger.info(f"Level up requested! Current level: {char.level}, XP: {char.experience}, XP needed: {char.xp_needed}")
+            attr = dm_result.attribute_increased
+            if char.try_level_up(dm_result.hp_increase, attr):
                 character_modified = True
-                logger.info(f"Level up complete! New level: {char.level}, Remaining XP: {char.experience}")
+                logger.info(f"Level up complete! New level: {char.level}, increased {attr}, HP +{dm_result.hp_increase}, remaining XP: {char.experience}")
             else:
-                logger.warning(f"Level up requested but not enough XP! Has {char.experience}, needs {xp_needed}")
+                logger.warning(f"Level up requested but not enough XP! Has {char.experience}, needs {char.xp_needed}")
         else:
             logger.warning(f"Level up requested but no character found for player {action.player_id}")
     
-    # Update character in database if modified
-    if character_modified and game.characters.get(action.player_id):
-        db = SessionLocal()
-        try:
-            # Ensure we have the character mapping
-            if game.game_id not in _character_mappings:
-                _character_mappings[game.game_id] = {}
-            
-            char_id = _character_mappings[game.game_id].get(action.player_id)
-            logger.info(f"Character modified. Mapping exists: {game.game_id in _character_mappings}, char_id: {char_id}")
-            if char_id:
-                logger.info(f"Updating character {char_id} in database")
-                update_character(db, char_id, game.characters[action.player_id])
-                logger.info(f"Character updated successfully")
-            else:
-                logger.warning(f"No char_id found for player {action.player_id} in game {game.game_id}")
-                logger.info(f"Available mappings: {_character_mappings}")
-        finally:
-            db.close()
-    
-    dm_response = Event(
+    game.logs.append(event)
+    dm_response = Event.model_construct(
         id=str(len(game.logs)+1),
         type="dm_response",
-        payload={"message": dm_result["message"]}
+        payload={"message": dm_result.message}
     )
     game.logs.append(dm_response)
     
-    # Persist game state to database
-    db = SessionLocal()
-    try:
-        save_game(db, game, _character_mappings.get(game.game_id, {}))
-    finally:
-        db.close()
-    
-    # advance turn
+    # Advance the turn before saving, so a reloaded game continues with the next player
     if len(game.players) > 0:
         game.turn_index = (game.turn_index + 1) % len(game.players)
-    return game
+    
+    # Persist the whole turn in one transaction: character, events and game state
+    with SessionLocal() as db, db.begin():
+        mappings = _get_mappings(db, game.game_id)
+        if created_char is not None:
+            # A new character is inserted with any XP or level gained this turn already applied
+            player_name = next((p.name for p in game.players if p.id == action.player_id), "Unknown")
+            char_id = save_character(db, created_char, player_name)
+            mappings[action.player_id] = char_id
+            logger.info(f"Created new character {char_id} for player {action.player_id}")
+        elif character_modified and game.characters.get(action.player_id):
+            char_id = mappings.get(action.player_id)
+            logger.info(f"Character modified. char_id: {char_id}")
+            if char_id:
+                logger.info(f"Updating character {char_id} in database")
+                update_character(db, char_id, game.characters[action.player_id])
+            else:
+                logger.warning(f"No char_id found for player {action.player_id} in game {game.game_id}")
+                logger.info(f"Available mappings: {mappings}")
+        
+        with batched_game(db, game.game_id) as batch:
+            batch.append(event)
+            batch.append(dm_response)
+        # Mappings only change when a character was created this turn
+        save_game(db, game, mappings if created_char is not None else None)
+    
+    # Mark the game as recently used (and re-add it if it was evicted during the turn)
+    _cache_game(game, mappings)
+
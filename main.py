@@ -1,9 +1,17 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
+import asyncio
 import logging
+
+# Load environment variables from .env file before importing the app modules,
+# which read their settings (DATABASE_URL, GAME_CACHE_SIZE) at import time
+load_dotenv()
+
 from app.routes import router
 from app.database import init_db
+from app.dm_agent import warm_up_dm_agent, close_http_clients
 
 # Configure logging
 logging.basicConfig(
@@ -11,25 +19,46 @@ logging.basicConfig(
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
-# Load environment variables from .env file
-load_dotenv()
-
 # Initialize database
 init_db()
 
-app = FastAPI(title="nagy-kaland-ag")
 
-# CORS configuration for frontend access
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the DM agent and connect to the model in the background: startup isn't
+    # delayed, and the first player action usually finds everything ready
+    warm_up = asyncio.create_task(warm_up_dm_agent())
+    yield
+    warm_up.cancel()
+    await close_http_clients()
+
+
+app = FastAPI(title="nagy-kaland-ag", lifespan=lifespan)
+
+# CORS configuration for frontend access, limited to what the API actually uses
+ALLOWED_ORIGINS = ("http://localhost:5173", "http://127.0.0.1:5173")
+ALLOWED_METHODS = ("GET", "POST")
+ALLOWED_HEADERS = ("Content-Type", "Authorization")
+
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["http://localhost:5173", "http://127.0.0.1:5173"],
+    allow_origins=ALLOWED_ORIGINS,
     allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    allow_methods=ALLOWED_METHODS,
+    allow_headers=ALLOWED_HEADERS,
 )
 
 app.include_router(router)
 
 if __name__ == "__main__":
+    import os
     import uvicorn
-    uvicorn.run("main:app", host="127.0.0.1", port=8000, reload=True)
+    # uvloop and httptools are used automatically when installed (uvicorn[standard]).
+    # Games and their turn locks live in process memory, so the server must run as a
+    # single worker.
+    uvicorn.run(
+        "main:app",
+        host=os.getenv("HOST", "127.0.0.1"),
+        port=int(os.getenv("PORT", "8000")),
+        reload=os.getenv("DEV") == "1",
+    )
@@ -0,0 +1,39 @@
+"""
+Tests for the DM agent's response cache key
+"""
+import unittest
+
+from langchain_core.messages import HumanMessage
+
+from app.dm_agent import _cache_key
+
+
+class CacheKeyTest(unittest.TestCase):
+    def key(self, player_message):
+        return _cache_key(player_message, [HumanMessage(content=f"Player 1: {player_message}")])
+
+    def test_tool_requests_bypass_the_cache(self):
+        for message in (
+            "I roll a d20",
+            "rolling for perception",
+            "I rolled badly",
+            "attacking the goblin",
+            "levels?",
+            "can I level up",
+            "how much XP do I have",
+            "creating my character",
+            "show my characters",
+        ):
+            with self.subTest(message=message):
+                self.assertIsNone(self.key(message))
+
+    def test_narrative_messages_are_cached(self):
+        key = self.key("I open the door and look around")
+
+        self.assertIsNotNone(key)
+        self.assertEqual(key, self.key("I open the door and look around"))
+        self.assertNotEqual(key, self.key("I close the door"))
+
+
+if __name__ == "__main__":
+    unittest.main()
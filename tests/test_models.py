@@ -0,0 +1,56 @@
+"""
+Tests for character experience and level ups
+"""
+import unittest
+
+from app.models import Character, VALID_ATTRIBUTES, XP_PER_LEVEL
+
+
+class CharacterProgressionTest(unittest.TestCase):
+    def setUp(self):
+        self.character = Character(name="Alice", class_type="Warrior")
+
+    def test_xp_accumulates_until_the_threshold(self):
+        self.assertFalse(self.character.grant_xp(XP_PER_LEVEL - 10))
+        self.assertFalse(self.character.grant_xp(5))
+        self.assertTrue(self.character.grant_xp(5))
+        self.assertEqual(self.character.experience, XP_PER_LEVEL)
+
+    def test_threshold_grows_with_level(self):
+        self.character.level = 3
+        self.assertEqual(self.character.xp_needed, 3 * XP_PER_LEVEL)
+        self.assertFalse(self.character.grant_xp(2 * XP_PER_LEVEL))
+
+    def test_level_up_without_enough_xp_changes_nothing(self):
+        self.character.grant_xp(XP_PER_LEVEL - 1)
+        before = self.character.model_dump()
+
+        self.assertFalse(self.character.try_level_up(5, "strength"))
+        self.assertEqual(self.character.model_dump(), before)
+
+    def test_level_up_spends_xp_and_restores_hp(self):
+        self.character.hit_points = 3
+        self.character.grant_xp(XP_PER_LEVEL + 30)
+
+        self.assertTrue(self.character.try_level_up(6, "wisdom"))
+        self.assertEqual(self.character.level, 2)
+        self.assertEqual(self.character.experience, 30)
+        self.assertEqual(self.character.max_hit_points, 16)
+        self.assertEqual(self.character.hit_points, 16)
+        self.assertEqual(self.character.wisdom, 11)
+
+    def test_level_up_ignores_attributes_outside_the_whitelist(self):
+        for attribute in ("level", "hit_points", "__class__", "unknown"):
+            with self.subTest(attribute=attribute):
+                character = Character(name="Bob", class_type="Rogue")
+                character.grant_xp(XP_PER_LEVEL)
+
+                self.assertTrue(character.try_level_up(4, attribute))
+                self.assertEqual(character.level, 2)
+                self.assertEqual(character.hit_points, 14)
+                self.assertIs(character.__class__, Character)
+                self.assertEqual([getattr(character, name) for name in VALID_ATTRIBUTES], [10] * len(VALID_ATTRIBUTES))
+
+
+if __name__ == "__main__":
+    unittest.main()
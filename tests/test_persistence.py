@@ -0,0 +1,84 @@
+"""
+Tests for loading games whose event log is split between the legacy JSON column and game_events
+"""
+import unittest
+
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.database import Base, DBGame, DBGameEvent
+from app.models import Event, GameState, Player
+from app.persistence import batched_game, load_game, save_game
+
+
+class LoadGameTest(unittest.TestCase):
+    def setUp(self):
+        engine = create_engine("sqlite://", poolclass=StaticPool)
+        Base.metadata.create_all(bind=engine)
+        self.db = sessionmaker(bind=engine)()
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_legacy_logs_come_before_event_rows(self):
+        self.db.add(DBGame(
+            game_id="g1",
+            turn_index=0,
+            meta={},
+            logs=[
+                {"id": "1", "type": "player_message", "payload": {"player_id": "1", "message": "hello"}},
+                {"id": "2", "type": "dm_response", "payload": {"message": "welcome"}},
+            ]
+        ))
+        self.db.add_all([
+            DBGameEvent(game_id="g1", seq=4, type="dm_response", payload={"message": "it moves"}),
+            DBGameEvent(game_id="g1", seq=3, type="player_message", payload={"player_id": "1", "message": "look"}),
+        ])
+        self.db.commit()
+
+        game, mappings = load_game(self.db, "g1")
+
+        self.assertEqual([log.id for log in game.logs], ["1", "2", "3", "4"])
+        self.assertEqual(
+            [log.payload["message"] for log in game.logs],
+            ["hello", "welcome", "look", "it moves"]
+        )
+        self.assertEqual(mappings, {})
+
+    def test_saved_turns_round_trip(self):
+        game = GameState.create(players=[Player(id="1", name="alice")])
+        with self.db.begin():
+            save_game(self.db, game, {})
+
+        player_event = Event(id="1", type="player_message", payload={"player_id": "1", "message": "hi"})
+        dm_event = Event(id="2", type="dm_response", payload={"message": "hello"})
+        game.logs.extend([player_event, dm_event])
+        with self.db.begin():
+            with batched_game(self.db, game.game_id) as batch:
+                batch.append(player_event)
+                batch.append(dm_event)
+            save_game(self.db, game, None)
+
+        loaded, _ = load_game(self.db, game.game_id)
+
+        self.assertEqual(
+            [(log.id, log.type, log.payload) for log in loaded.logs],
+            [(log.id, log.type, log.payload) for log in game.logs]
+        )
+
+    def test_players_without_characters_survive_a_reload(self):
+        game = GameState.create(players=[Player(id="1", name="alice"), Player(id="2", name="bob")])
+        game.turn_index = 1
+        with self.db.begin():
+            save_game(self.db, game, {})
+
+        loaded, mappings = load_game(self.db, game.game_id)
+
+        self.assertEqual([(p.id, p.name) for p in loaded.players], [("1", "alice"), ("2", "bob")])
+        self.assertEqual(loaded.turn_index, 1)
+        self.assertEqual(mappings, {})
+
+
+if __name__ == "__main__":
+    unittest.main()